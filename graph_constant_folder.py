@@ -1,8 +1,10 @@
 import os
+import sys
 import time
 import json
 import logging
 import re
+from collections import deque
 from typing import Any, Dict, Tuple, Optional, Set, List
 
 _LOG_PREFIX = "[GraphConstantFolder]"
@@ -18,6 +20,9 @@ def _log_verbose(msg: str) -> None:
 	if _VERBOSE:
 		logging.info(f"{_LOG_PREFIX} {msg}")
 
+def _log_noop(msg: str) -> None:
+	return None
+
 def _load_local_config() -> Dict[str, Any]:
 	path = os.path.join(os.path.dirname(__file__), "graph_constant_folder_config.json")
 	if not os.path.isfile(path):
@@ -31,11 +36,14 @@ def _load_local_config() -> Dict[str, Any]:
 		_log_info(f"failed to read config file '{path}': {e}")
 		return {}
 
+_TRUTHY_STRS = frozenset({"1", "true", "yes", "on"})
+_FALSY_STRS = frozenset({"0", "false", "no", "off", ""})
+
 def _truthy_str(v: str) -> bool:
-	return v.strip() in ("1", "true", "True", "yes", "YES", "on", "ON")
+	return v.strip().lower() in _TRUTHY_STRS
 
 def _falsy_str(v: str) -> bool:
-	return v.strip() in ("0", "false", "False", "no", "NO", "off", "OFF", "")
+	return v.strip().lower() in _FALSY_STRS
 
 def _get_flag(cfg: Dict[str, Any], cfg_key: str, env_names: List[str], default: bool) -> bool:
 	for n in env_names:
@@ -64,16 +72,18 @@ def _get_flag(cfg: Dict[str, Any], cfg_key: str, env_names: List[str], default:
 
 _CFG = _load_local_config()
 
-# Env vars: support both new prefix and legacy shorthand.
-_ENABLED = _get_flag(_CFG, "ENABLED", ["GRAPH_CONSTANT_FOLDER_ENABLED", "GCF_ENABLED", "ENABLED"], default=True)
-_DEBUG = _get_flag(_CFG, "DEBUG", ["GRAPH_CONSTANT_FOLDER_DEBUG", "GCF_DEBUG", "DEBUG"], default=False)
-_VERBOSE = _get_flag(_CFG, "VERBOSE", ["GRAPH_CONSTANT_FOLDER_VERBOSE", "GCF_VERBOSE", "VERBOSE"], default=False)
-_PRUNE = _get_flag(_CFG, "PRUNE", ["GRAPH_CONSTANT_FOLDER_PRUNE", "GCF_PRUNE", "PRUNE"], default=False)
+# Env vars: the full prefix and the GCF_ shorthand. Bare names like DEBUG are
+# deliberately not honored; they collide with unrelated environment entries.
+_ENABLED = _get_flag(_CFG, "ENABLED", ["GRAPH_CONSTANT_FOLDER_ENABLED", "GCF_ENABLED"], default=True)
+_DEBUG = _get_flag(_CFG, "DEBUG", ["GRAPH_CONSTANT_FOLDER_DEBUG", "GCF_DEBUG"], default=False)
+_VERBOSE = _get_flag(_CFG, "VERBOSE", ["GRAPH_CONSTANT_FOLDER_VERBOSE", "GCF_VERBOSE"], default=False)
+_PRUNE = _get_flag(_CFG, "PRUNE", ["GRAPH_CONSTANT_FOLDER_PRUNE", "GCF_PRUNE"], default=False)
 
 # --- constant resolution -----------------------------------------------------
 
 _DEFAULT_CONST_CLASS_RE = r"(?i)(?:primitive|constant|literal|bool\s*primitive|int\s*primitive|float\s*primitive)"
 _CONST_CLASS_RE = re.compile(os.environ.get("GRAPH_CONSTANT_FOLDER_CONST_CLASS_TYPES", _DEFAULT_CONST_CLASS_RE))
+_INT_RE = re.compile(r"[+-]?\d+")
 
 try:
 	from comfy_execution.graph_utils import is_link as _is_link
@@ -81,6 +91,28 @@ except Exception:
 	def _is_link(v: Any) -> bool:
 		return isinstance(v, list) and len(v) == 2 and isinstance(v[1], int)
 
+# Read-only fast-path tables for string-literal coercion. The same handful of
+# literals ("true", "1", ...) shows up on node after node, so one dict hit
+# replaces the strip/lower allocation and membership tests. Deliberately never
+# written at runtime: the coercers see arbitrary prompt strings (including
+# whole text widget values) and writing those back would grow the tables for
+# the life of the server process.
+_COERCE_MISS = object()
+
+_BOOL_TRUE_LOWER = frozenset({"true", "yes", "on", "1"})
+_BOOL_FALSE_LOWER = frozenset({"false", "no", "off", "0", ""})
+
+_BOOL_LITERAL_CACHE: Dict[str, Optional[bool]] = {}
+for _tok in _BOOL_TRUE_LOWER:
+	for _variant in (_tok, _tok.capitalize(), _tok.upper()):
+		_BOOL_LITERAL_CACHE[_variant] = True
+for _tok in _BOOL_FALSE_LOWER:
+	for _variant in (_tok, _tok.capitalize(), _tok.upper()):
+		_BOOL_LITERAL_CACHE[_variant] = False
+del _tok, _variant
+
+_INT_LITERAL_CACHE: Dict[str, Optional[int]] = {str(i): i for i in range(-1, 17)}
+
 def _coerce_bool(v: Any) -> Optional[bool]:
 	if isinstance(v, bool):
 		return v
@@ -95,10 +127,13 @@ def _coerce_bool(v: Any) -> Optional[bool]:
 			return True
 		return None
 	if isinstance(v, str):
+		hit = _BOOL_LITERAL_CACHE.get(v, _COERCE_MISS)
+		if hit is not _COERCE_MISS:
+			return hit
 		s = v.strip().lower()
-		if s in ("true", "yes", "on", "1"):
+		if s in _BOOL_TRUE_LOWER:
 			return True
-		if s in ("false", "no", "off", "0", ""):
+		if s in _BOOL_FALSE_LOWER:
 			return False
 	return None
 
@@ -110,8 +145,11 @@ def _coerce_int(v: Any) -> Optional[int]:
 	if isinstance(v, float) and v.is_integer():
 		return int(v)
 	if isinstance(v, str):
+		hit = _INT_LITERAL_CACHE.get(v, _COERCE_MISS)
+		if hit is not _COERCE_MISS:
+			return hit
 		s = v.strip()
-		if re.fullmatch(r"[+-]?\d+", s):
+		if _INT_RE.fullmatch(s):
 			try:
 				return int(s)
 			except Exception:
@@ -232,116 +270,148 @@ def _get_inputs(node: Dict[str, Any]) -> Dict[str, Any]:
 	inp = node.get("inputs", None)
 	return inp if isinstance(inp, dict) else {}
 
-def _resolve_constant(prompt: Dict[str, Any], value: Any, want: str, cache: Dict[Tuple[str, int, str], Any], depth: int = 12) -> Any:
-	# direct literal
+def _coerce_want(value: Any, want: str) -> Any:
 	if want == "bool":
-		b = _coerce_bool(value)
-		if b is not None:
-			return b
-	elif want == "int":
-		i = _coerce_int(value)
-		if i is not None:
-			return i
-	elif want == "str":
-		s = _coerce_str(value)
-		if s is not None:
-			return s
-	else:
+		return _coerce_bool(value)
+	if want == "int":
+		return _coerce_int(value)
+	if want == "str":
+		return _coerce_str(value)
+	return None
+
+def _resolve_constant(prompt: Dict[str, Any], value: Any, want: str, cache: Dict[Tuple[str, int, str], Any], depth: int = 12, replacements: Optional[Dict[str, Any]] = None) -> Any:
+	# direct literal
+	res = _coerce_want(value, want)
+	if res is not None:
+		return res
+	if want not in ("bool", "int", "str"):
 		return None
 
 	if depth <= 0 or not _is_link(value):
 		return None
 
-	src_id = str(value[0])
-	out_idx = int(value[1])
-	key = (src_id, out_idx, want)
-	if key in cache:
-		return cache[key]
+	# Links into already-folded nodes resolve through the pending replacements
+	# so a fold becomes visible upstream before the prompt is rewritten.
+	if replacements:
+		value = _resolve_replacement_chain(replacements, value)
+		if not _is_link(value):
+			return _coerce_want(value, want)
+
+	# Follow reroute-like pass-through chains iteratively instead of recursing,
+	# remembering every intermediate cache key so the final result is written
+	# back for the whole chain (path compression): each reroute resolves in one
+	# cache hit on subsequent queries.
+	chain_keys: List[Tuple[str, int, str]] = []
+	is_link = _is_link
+
+	def _store(res: Any) -> Any:
+		cache[key] = res
+		for ck in chain_keys:
+			cache[ck] = res
+		return res
+
+	while True:
+		v0 = value[0]
+		# Interned ids make the (src_id, out_idx, want) cache keys hash and
+		# compare by pointer identity; the `want` literals are compiler-interned
+		# already.
+		src_id = sys.intern(v0 if isinstance(v0, str) else str(v0))
+		out_idx = int(value[1])
+		key = (src_id, out_idx, want)
+		if key in cache:
+			return _store(cache[key])
+
+		node = prompt.get(src_id, None)
+		if not isinstance(node, dict):
+			return _store(None)
 
-	node = prompt.get(src_id, None)
-	if not isinstance(node, dict):
-		cache[key] = None
-		return None
+		class_type = str(node.get("class_type", ""))
+		inputs = _get_inputs(node)
+
+		if "reroute" in class_type.lower():
+			link_in = None
+			for v in inputs.values():
+				if is_link(v):
+					link_in = v
+					break
+			if link_in is not None:
+				if len(chain_keys) >= depth:
+					return _store(None)
+				if replacements:
+					link_in = _resolve_replacement_chain(replacements, link_in)
+					if not is_link(link_in):
+						return _store(_coerce_want(link_in, want))
+				chain_keys.append(key)
+				value = link_in
+				continue
+		break
 
-	class_type = str(node.get("class_type", ""))
 	canonical_class_type = _canonical_class_type(class_type)
-	inputs = _get_inputs(node)
 
-	# Reroute-like pass-through
-	if "reroute" in class_type.lower():
-		link_in = None
-		for v in inputs.values():
-			if _is_link(v):
-				link_in = v
-				break
-		if link_in is not None:
-			res = _resolve_constant(prompt, link_in, want, cache, depth - 1)
-			cache[key] = res
-			return res
-
-	# Constant-like sources: class name matches AND no linked inputs
-	if _CONST_CLASS_RE.search(class_type) and not any(_is_link(v) for v in inputs.values()):
-		candidates = []
-		for k in (
-			"value", "bool", "boolean", "boolean_value", "state", "enabled", "enable",
-			"switch", "toggle", "flag", "index", "int", "number", "string", "text"
-		):
-			if k in inputs:
-				candidates.append(inputs.get(k))
-
-		if not candidates and len(inputs) == 1:
-			candidates.append(next(iter(inputs.values())))
-
-		for c in candidates:
-			if want == "bool":
-				res = _coerce_bool(c)
-				if res is not None:
-					cache[key] = res
-					return res
-			elif want == "int":
-				res = _coerce_int(c)
-				if res is not None:
-					cache[key] = res
-					return res
-			elif want == "str":
-				res = _coerce_str(c)
-				if res is not None:
-					cache[key] = res
-					return res
+	# Constant-like sources: class name matches AND no linked inputs. Inputs are
+	# viewed through the pending replacements first, so a link whose chain
+	# already terminates in a literal counts as that literal -- the same value
+	# _apply_replacements will rewrite it to.
+	if _CONST_CLASS_RE.search(class_type):
+		values = inputs
+		if replacements:
+			values = {k: _resolve_replacement_chain(replacements, v) for k, v in inputs.items()}
+		if not any(is_link(v) for v in values.values()):
+			candidates = []
+			for k in (
+				"value", "bool", "boolean", "boolean_value", "state", "enabled", "enable",
+				"switch", "toggle", "flag", "index", "int", "number", "string", "text"
+			):
+				if k in values:
+					candidates.append(values.get(k))
+
+			if not candidates and len(values) == 1:
+				candidates.append(next(iter(values.values())))
+
+			for c in candidates:
+				if want == "bool":
+					res = _coerce_bool(c)
+					if res is not None:
+						return _store(res)
+				elif want == "int":
+					res = _coerce_int(c)
+					if res is not None:
+						return _store(res)
+				elif want == "str":
+					res = _coerce_str(c)
+					if res is not None:
+						return _store(res)
 
 	if want == "int" and canonical_class_type in ("EnumCombo", "EnumComboAdvanced") and out_idx == 0:
-		choice = _resolve_constant(prompt, inputs.get("choice", None), "str", cache, depth - 1)
-		enum_definition = _resolve_constant(prompt, inputs.get("enum_definition", None), "str", cache, depth - 1)
+		choice = _resolve_constant(prompt, inputs.get("choice", None), "str", cache, depth - 1, replacements)
+		enum_definition = _resolve_constant(prompt, inputs.get("enum_definition", None), "str", cache, depth - 1, replacements)
 		start = 0
 		if canonical_class_type == "EnumComboAdvanced":
-			raw_start = _resolve_constant(prompt, inputs.get("start", 0), "int", cache, depth - 1)
+			raw_start = _resolve_constant(prompt, inputs.get("start", 0), "int", cache, depth - 1, replacements)
 			if isinstance(raw_start, int):
 				start = raw_start
 
 		if isinstance(choice, str) and isinstance(enum_definition, str):
 			res = _parse_enum_choice_value(enum_definition, choice, start)
 			if res is not None:
-				cache[key] = res
-				return res
+				return _store(res)
 
 	if want == "bool" and canonical_class_type == "CM_IntBinaryCondition" and out_idx == 0:
-		op = _resolve_constant(prompt, inputs.get("op", None), "str", cache, depth - 1)
-		a = _resolve_constant(prompt, inputs.get("a", None), "int", cache, depth - 1)
-		b = _resolve_constant(prompt, inputs.get("b", None), "int", cache, depth - 1)
+		op = _resolve_constant(prompt, inputs.get("op", None), "str", cache, depth - 1, replacements)
+		a = _resolve_constant(prompt, inputs.get("a", None), "int", cache, depth - 1, replacements)
+		b = _resolve_constant(prompt, inputs.get("b", None), "int", cache, depth - 1, replacements)
 		if isinstance(op, str) and isinstance(a, int) and isinstance(b, int):
 			res = _compare_int_values(op, a, b)
 			if res is not None:
-				cache[key] = res
-				return res
+				return _store(res)
 
-	cache[key] = None
-	return None
+	return _store(None)
 
 # --- folding rules -----------------------------------------------------------
 
-def _try_fold_bool_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], decision_key: str, false_key: str, true_key: str) -> Optional[Any]:
+def _try_fold_bool_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any], decision_key: str, false_key: str, true_key: str) -> Optional[Any]:
 	switch_raw = node_inputs.get(decision_key, None)
-	switch = _resolve_constant(prompt, switch_raw, "bool", cache)
+	switch = _resolve_constant(prompt, switch_raw, "bool", cache, replacements=replacements)
 	if not isinstance(switch, bool):
 		return None
 
@@ -350,9 +420,9 @@ def _try_fold_bool_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any], c
 
 	return (node_inputs.get(true_key) if switch else node_inputs.get(false_key))
 
-def _try_fold_index_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], decision_key: str, value_prefix: str) -> Optional[Any]:
+def _try_fold_index_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any], decision_key: str, value_prefix: str) -> Optional[Any]:
 	index_raw = node_inputs.get(decision_key, None)
-	index = _resolve_constant(prompt, index_raw, "int", cache)
+	index = _resolve_constant(prompt, index_raw, "int", cache, replacements=replacements)
 	if not isinstance(index, int):
 		return None
 
@@ -362,12 +432,13 @@ def _try_fold_index_switch(prompt: Dict[str, Any], node_inputs: Dict[str, Any],
 
 	return node_inputs.get(key)
 
-def _try_fold_lazy_conditional(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any]) -> Optional[Any]:
+def _try_fold_lazy_conditional(prompt: Dict[str, Any], node_inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any]) -> Optional[Any]:
+	# Plain-string test for "condition<N>"; cheaper than a regex per key.
 	cond_idxs = []
 	for k in node_inputs.keys():
-		m = re.fullmatch(r"condition(\d+)", str(k))
-		if m:
-			cond_idxs.append(int(m.group(1)))
+		s = str(k)
+		if s.startswith("condition") and s[9:].isdecimal():
+			cond_idxs.append(int(s[9:]))
 
 	if not cond_idxs:
 		return None
@@ -375,7 +446,7 @@ def _try_fold_lazy_conditional(prompt: Dict[str, Any], node_inputs: Dict[str, An
 	for i in sorted(cond_idxs):
 		cond_key = f"condition{i}"
 		cond_val_raw = node_inputs.get(cond_key, None)
-		cond_val = _resolve_constant(prompt, cond_val_raw, "bool", cache)
+		cond_val = _resolve_constant(prompt, cond_val_raw, "bool", cache, replacements=replacements)
 		if not isinstance(cond_val, bool):
 			return None
 
@@ -390,104 +461,165 @@ def _try_fold_lazy_conditional(prompt: Dict[str, Any], node_inputs: Dict[str, An
 
 	return None
 
-def _has_keys(d: Dict[str, Any], keys: List[str]) -> bool:
-	for k in keys:
-		if k not in d:
-			return False
-	return True
-
-def _is_bool_switch_like(inputs: Dict[str, Any]) -> bool:
-	if _has_keys(inputs, ["switch", "on_true", "on_false"]):
-		return True
-	if _has_keys(inputs, ["condition", "if_true", "if_false"]):
-		return True
-	return False
-
-def _is_index_switch_like(inputs: Dict[str, Any]) -> bool:
-	if "index" in inputs:
-		return ("value0" in inputs and "value1" in inputs)
-	return False
-
-def _constant_fold_switches(prompt: Dict[str, Any], skip_ids: Optional[Set[str]] = None) -> Tuple[Dict[str, Any], int, int, List[str]]:
+def _fold_bool_switch_on(prompt: Dict[str, Any], inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any]) -> Optional[Any]:
+	return _try_fold_bool_switch(prompt, inputs, cache, replacements, "switch", "on_false", "on_true")
+
+def _fold_bool_switch_if(prompt: Dict[str, Any], inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any]) -> Optional[Any]:
+	return _try_fold_bool_switch(prompt, inputs, cache, replacements, "condition", "if_false", "if_true")
+
+def _fold_index_switch(prompt: Dict[str, Any], inputs: Dict[str, Any], cache: Dict[Tuple[str, int, str], Any], replacements: Dict[str, Any]) -> Optional[Any]:
+	return _try_fold_index_switch(prompt, inputs, cache, replacements, "index", "value")
+
+# Known lazy classes, mapped to their canonical kind (LazySwitchKJ is a clone).
+_LAZY_KIND = {
+	"LazySwitch": "LazySwitch",
+	"LazySwitchKJ": "LazySwitch",
+	"LazyIndexSwitch": "LazyIndexSwitch",
+	"LazyConditional": "LazyConditional",
+}
+_KNOWN_LAZY = frozenset(_LAZY_KIND)
+
+_MSG_BOOL_SWITCH = "decision input not constant"
+_MSG_INDEX_SWITCH = "decision input not constant or missing valueN"
+_MSG_CONDITIONAL = "conditions not constant"
+
+# Static dispatch table keyed by a shape token:
+# (lazy_kind, has_switch_keys, has_condition_keys, has_index_keys).
+# Entry is None for non-candidates, otherwise (folder_or_None, fail_message);
+# a None folder marks a candidate with no usable key scheme (e.g. a LazySwitch
+# missing its branch inputs). Enumerated once at import so classification per
+# node is one dict lookup instead of a branch chain of _has_keys probes.
+_SHAPE_DISPATCH: Dict[Tuple[Optional[str], bool, bool, bool], Optional[Tuple[Optional[Any], str]]] = {}
+for _lazy in (None, "LazySwitch", "LazyIndexSwitch", "LazyConditional"):
+	for _sw in (False, True):
+		for _cond in (False, True):
+			for _idx in (False, True):
+				if _lazy == "LazyConditional":
+					_entry = (_try_fold_lazy_conditional, _MSG_CONDITIONAL)
+				elif _lazy == "LazyIndexSwitch":
+					_entry = (_fold_index_switch, _MSG_INDEX_SWITCH)
+				elif _lazy == "LazySwitch":
+					_entry = (_fold_bool_switch_on if _sw else (_fold_bool_switch_if if _cond else None), _MSG_BOOL_SWITCH)
+				elif _sw:
+					_entry = (_fold_bool_switch_on, _MSG_BOOL_SWITCH)
+				elif _cond:
+					_entry = (_fold_bool_switch_if, _MSG_BOOL_SWITCH)
+				elif _idx:
+					_entry = (_fold_index_switch, _MSG_INDEX_SWITCH)
+				else:
+					_entry = None
+				_SHAPE_DISPATCH[(_lazy, _sw, _cond, _idx)] = _entry
+del _lazy, _sw, _cond, _idx, _entry
+
+def _switch_dispatch_entry(node: Dict[str, Any]) -> Optional[Tuple[Optional[Any], str]]:
+	inputs = _get_inputs(node)
+	shape = (
+		_LAZY_KIND.get(_canonical_class_type(str(node.get("class_type", ""))), None),
+		"switch" in inputs and "on_true" in inputs and "on_false" in inputs,
+		"condition" in inputs and "if_true" in inputs and "if_false" in inputs,
+		"index" in inputs and "value0" in inputs and "value1" in inputs,
+	)
+	return _SHAPE_DISPATCH[shape]
+
+def _constant_fold_switches(prompt: Dict[str, Any], links: Optional[Dict[str, List[Tuple[str, str, int]]]] = None) -> Tuple[Dict[str, Any], int, int, List[str]]:
 	# Returns (replacements, fold_count, candidates, not_foldable_messages)
+	#
+	# Worklist sweep to fixpoint: when a node folds, every node downstream of it
+	# up to and including the next fold candidates is re-queued, and decision
+	# inputs resolve through the pending replacements (see _resolve_constant),
+	# so transitive folds land in this single sweep with no intermediate prompt
+	# rewrites.
 	replacements: Dict[str, Any] = {}
 	fold_count = 0
-	candidates = 0
+	candidate_ids: Set[str] = set()
 	cache: Dict[Tuple[str, int, str], Any] = {}
-	not_foldable: List[str] = []
-	skip_ids = skip_ids if skip_ids is not None else set()
+	not_foldable: Dict[str, str] = {}
 
-	for node_id, node in prompt.items():
-		if str(node_id) in skip_ids:
-			continue
-		if not isinstance(node, dict):
-			continue
+	if links is None:
+		links = _build_link_index(prompt)
 
-		class_type = str(node.get("class_type", ""))
-		canonical_class_type = _canonical_class_type(class_type)
-		inputs = _get_inputs(node)
-
-		kind = None
+	users: Dict[str, Set[str]] = {}
+	for node_id, entries in links.items():
+		for (_k, src_id, _out_idx) in entries:
+			users.setdefault(src_id, set()).add(node_id)
 
-		# Known lazy nodes
-		if canonical_class_type in ("LazySwitch", "LazyIndexSwitch", "LazyConditional"):
-			kind = canonical_class_type
-		elif canonical_class_type == "LazySwitchKJ":
-			kind = "LazySwitch"
+	worklist = deque(prompt.keys())
+	queued: Set[str] = set(worklist)
 
-		# Switch-like nodes (non-lazy)
-		elif _is_bool_switch_like(inputs):
-			kind = "BoolSwitchLike"
-		elif _is_index_switch_like(inputs):
-			kind = "IndexSwitchLike"
-
-		if kind is None:
+	while worklist:
+		node_id = worklist.popleft()
+		queued.discard(node_id)
+		if node_id in replacements:
+			continue
+		node = prompt.get(node_id, None)
+		if not isinstance(node, dict):
 			continue
 
-		candidates += 1
-		replacement = None
-
-		if kind in ("LazySwitch", "BoolSwitchLike"):
-			if _has_keys(inputs, ["switch", "on_true", "on_false"]):
-				replacement = _try_fold_bool_switch(prompt, inputs, cache, "switch", "on_false", "on_true")
-			elif _has_keys(inputs, ["condition", "if_true", "if_false"]):
-				replacement = _try_fold_bool_switch(prompt, inputs, cache, "condition", "if_false", "if_true")
-
-			if replacement is None and _VERBOSE:
-				not_foldable.append(f"not foldable: {class_type} #{node_id} (decision input not constant)")
+		entry = _switch_dispatch_entry(node)
+		if entry is None:
+			continue
 
-		elif kind in ("LazyIndexSwitch", "IndexSwitchLike"):
-			replacement = _try_fold_index_switch(prompt, inputs, cache, "index", "value")
-			if replacement is None and _VERBOSE:
-				not_foldable.append(f"not foldable: {class_type} #{node_id} (decision input not constant or missing valueN)")
+		class_type = str(node.get("class_type", ""))
+		inputs = _get_inputs(node)
 
-		elif kind == "LazyConditional":
-			replacement = _try_fold_lazy_conditional(prompt, inputs, cache)
-			if replacement is None and _VERBOSE:
-				not_foldable.append(f"not foldable: {class_type} #{node_id} (conditions not constant)")
+		candidate_ids.add(node_id)
+		folder, fail_msg = entry
+		replacement = folder(prompt, inputs, cache, replacements) if folder is not None else None
 
 		if replacement is None:
+			if _VERBOSE:
+				not_foldable[node_id] = f"not foldable: {class_type} #{node_id} ({fail_msg})"
 			continue
 
-		replacements[str(node_id)] = replacement
+		not_foldable.pop(node_id, None)
+		replacements[node_id] = replacement
 		fold_count += 1
-
-	return (replacements, fold_count, candidates, not_foldable)
+		# Resolution results may have assumed this node was opaque; start the
+		# cache fresh so its users re-resolve against the new replacement.
+		cache.clear()
+		# Re-queue users of the fold. A candidate's decision can depend on the
+		# fold through intermediates that won't re-fold themselves:
+		# non-candidates (reroutes, EnumCombo, CM_IntBinaryCondition) pass the
+		# new value along, and already-folded nodes now resolve one chain hop
+		# further. Propagation continues through both until it reaches live
+		# candidates.
+		pending = deque((node_id,))
+		propagated: Set[str] = {node_id}
+		while pending:
+			src_id = pending.popleft()
+			for uid in users.get(src_id, ()):
+				if uid in propagated:
+					continue
+				propagated.add(uid)
+				if uid in replacements:
+					pending.append(uid)
+					continue
+				if uid not in queued:
+					worklist.append(uid)
+					queued.add(uid)
+				unode = prompt.get(uid, None)
+				if isinstance(unode, dict) and _switch_dispatch_entry(unode) is None:
+					pending.append(uid)
+
+	return (replacements, fold_count, len(candidate_ids), list(not_foldable.values()))
 
 def _resolve_replacement_chain(replacements: Dict[str, Any], value: Any) -> Any:
-	seen: Set[str] = set()
+	# Chains are short (usually 1-3 hops); bounding the walk by the number of
+	# replacements terminates any cycle without allocating a seen-set per call.
 	v = value
-	while _is_link(v):
-		src = str(v[0])
-		if src in seen or src not in replacements:
+	is_link = _is_link
+	for _ in range(len(replacements) + 1):
+		if not is_link(v):
+			break
+		src = v[0] if isinstance(v[0], str) else str(v[0])
+		if src not in replacements:
 			break
-		seen.add(src)
 		v = replacements[src]
 	return v
 
 def _rewrite_value(value: Any, replacements: Dict[str, Any]) -> Tuple[Any, bool]:
 	if _is_link(value):
-		src_id = str(value[0])
+		src_id = value[0] if isinstance(value[0], str) else str(value[0])
 		out_idx = value[1]
 		if out_idx == 0 and src_id in replacements:
 			new_v = _resolve_replacement_chain(replacements, replacements[src_id])
@@ -515,72 +647,117 @@ def _rewrite_value(value: Any, replacements: Dict[str, Any]) -> Tuple[Any, bool]
 
 	return (value, False)
 
-def _apply_replacements(prompt: Dict[str, Any], replacements: Dict[str, Any]) -> Set[str]:
+def _apply_replacements(prompt: Dict[str, Any], replacements: Dict[str, Any], links: Optional[Dict[str, List[Tuple[str, str, int]]]] = None) -> Set[str]:
 	changed_nodes: Set[str] = set()
-	for node_id, node in prompt.items():
+	if not replacements:
+		return changed_nodes
+
+	# Visit only the nodes whose link table references a folded source, and
+	# within those only the affected input keys; the vast majority of inputs
+	# never point at a folded node and are skipped entirely.
+	if links is None:
+		links = _build_link_index(prompt)
+	for node_id, entries in links.items():
+		affected_keys = {k for (k, src_id, _out_idx) in entries if src_id in replacements}
+		if not affected_keys:
+			continue
+		node = prompt.get(node_id, None)
 		if not isinstance(node, dict):
 			continue
 		inputs = node.get("inputs", None)
 		if not isinstance(inputs, dict):
 			continue
-		new_inputs, changed = _rewrite_value(inputs, replacements)
-		if changed:
-			node["inputs"] = new_inputs
-			changed_nodes.add(str(node_id))
+		for k in affected_keys:
+			v = inputs.get(k, None)
+			# Direct links are by far the common case; handle them inline and
+			# keep the recursive _rewrite_value for the rare nested container.
+			if isinstance(v, list) and len(v) == 2 and isinstance(v[1], int):
+				src_id = v[0] if isinstance(v[0], str) else str(v[0])
+				if v[1] == 0 and src_id in replacements:
+					new_v = _resolve_replacement_chain(replacements, replacements[src_id])
+					if new_v != v:
+						inputs[k] = new_v
+						changed_nodes.add(node_id)
+				continue
+			new_v, changed = _rewrite_value(v, replacements)
+			if changed:
+				inputs[k] = new_v
+				changed_nodes.add(node_id)
 	return changed_nodes
 
-def _walk_upstream(prompt: Dict[str, Any], start_nodes: Set[str]) -> Set[str]:
-	reachable: Set[str] = set()
-	stack = list(start_nodes)
-	while stack:
-		nid = str(stack.pop())
-		if nid in reachable:
-			continue
-		reachable.add(nid)
-		node = prompt.get(nid, None)
+def _build_link_index(prompt: Dict[str, Any]) -> Dict[str, List[Tuple[str, str, int]]]:
+	# One flat pass over the prompt: node_id -> [(input_key, src_id, out_idx)]
+	# for every link input, including links one level inside list/dict values.
+	# Downstream passes iterate this table instead of re-scanning inputs.
+	links: Dict[str, List[Tuple[str, str, int]]] = {}
+	is_link = _is_link  # local binding; this is called per input value
+	for node_id, node in prompt.items():
 		if not isinstance(node, dict):
 			continue
 		inputs = node.get("inputs", None)
 		if not isinstance(inputs, dict):
 			continue
-
-		def push_link(v: Any) -> None:
-			if _is_link(v):
-				stack.append(str(v[0]))
+		entries: List[Tuple[str, str, int]] = []
+		for k, v in inputs.items():
+			if is_link(v):
+				v0 = v[0]
+				entries.append((k, v0 if isinstance(v0, str) else str(v0), v[1]))
 			elif isinstance(v, list):
 				for vv in v:
-					if _is_link(vv):
-						stack.append(str(vv[0]))
+					if is_link(vv):
+						v0 = vv[0]
+						entries.append((k, v0 if isinstance(v0, str) else str(v0), vv[1]))
 			elif isinstance(v, dict):
 				for vv in v.values():
-					if _is_link(vv):
-						stack.append(str(vv[0]))
+					if is_link(vv):
+						v0 = vv[0]
+						entries.append((k, v0 if isinstance(v0, str) else str(v0), vv[1]))
+		if entries:
+			links[node_id] = entries
+	return links
 
-		for v in inputs.values():
-			push_link(v)
+def _walk_upstream(prompt: Dict[str, Any], start_nodes: Set[str]) -> Set[str]:
+	links = _build_link_index(prompt)
+	reachable: Set[str] = set()
+	stack = deque(start_nodes)
+	# Bound methods hoisted out of the BFS loop; attribute lookups add up on
+	# large prompt graphs.
+	reachable_add = reachable.add
+	stack_append = stack.append
+	while stack:
+		nid = stack.pop()
+		if nid in reachable:
+			continue
+		reachable_add(nid)
+		for _k, src_id, _out_idx in links.get(nid, ()):
+			if src_id not in reachable:
+				stack_append(src_id)
 
 	return reachable
 
+# Which class_types are OUTPUT_NODE is constant across prompts: custom nodes
+# are all registered before the server accepts its first prompt, so computing
+# the set once on first use is safe.
+_OUTPUT_CLASSES: Optional[frozenset] = None
+
 def _collect_outputs(prompt: Dict[str, Any], prefer_targets: Optional[Set[str]] = None) -> Set[str]:
+	global _OUTPUT_CLASSES
+
 	if prefer_targets:
 		return set(str(x) for x in prefer_targets)
 
-	try:
-		import nodes as comfy_nodes
-	except Exception:
-		return set()
+	if _OUTPUT_CLASSES is None:
+		try:
+			import nodes as comfy_nodes
+		except Exception:
+			return set()
+		_OUTPUT_CLASSES = frozenset(
+			k for k, v in comfy_nodes.NODE_CLASS_MAPPINGS.items()
+			if getattr(v, "OUTPUT_NODE", False) is True
+		)
 
-	outputs: Set[str] = set()
-	for node_id, node in prompt.items():
-		class_type = node.get("class_type", None)
-		if not class_type:
-			continue
-		class_def = comfy_nodes.NODE_CLASS_MAPPINGS.get(class_type, None)
-		if class_def is None:
-			continue
-		if getattr(class_def, "OUTPUT_NODE", False) is True:
-			outputs.add(str(node_id))
-	return outputs
+	output_classes = _OUTPUT_CLASSES
+	return {node_id for node_id, node in prompt.items() if node.get("class_type", None) in output_classes}
 
 def _extract_partial_targets(json_data: Dict[str, Any]) -> Optional[Set[str]]:
 	for k in ("partial_execution_targets", "partial_execution_list", "partial_execution_nodes", "partial_execution"):
@@ -593,16 +770,27 @@ def _extract_partial_targets(json_data: Dict[str, Any]) -> Optional[Set[str]]:
 	return None
 
 def _prune_unreachable(prompt: Dict[str, Any], start_nodes: Set[str]) -> Tuple[Dict[str, Any], int]:
+	# Mutates the prompt in place; rebuilding the dict just to drop a few keys
+	# costs an O(N) allocation and rehash on large prompts.
 	reachable = _walk_upstream(prompt, start_nodes)
-	removed = 0
-	new_prompt: Dict[str, Any] = {}
-	for node_id, node in prompt.items():
-		sid = str(node_id)
-		if sid in reachable:
-			new_prompt[sid] = node
-		else:
-			removed += 1
-	return (new_prompt, removed)
+	unreachable = [node_id for node_id in prompt if node_id not in reachable]
+	for node_id in unreachable:
+		del prompt[node_id]
+	return (prompt, len(unreachable))
+
+def _prompt_has_switch_candidates(prompt: Dict[str, Any]) -> bool:
+	# Deliberately a superset test of the real candidate shapes: any known lazy
+	# class, or any node carrying one of the decision-input tokens. A miss here
+	# guarantees the folding pass would find nothing.
+	for node in prompt.values():
+		if not isinstance(node, dict):
+			continue
+		if _canonical_class_type(str(node.get("class_type", ""))) in _KNOWN_LAZY:
+			return True
+		inputs = node.get("inputs", None)
+		if isinstance(inputs, dict) and ("switch" in inputs or "condition" in inputs or "index" in inputs):
+			return True
+	return False
 
 def _handler(json_data: Dict[str, Any]) -> Dict[str, Any]:
 	if not _ENABLED:
@@ -612,26 +800,27 @@ def _handler(json_data: Dict[str, Any]) -> Dict[str, Any]:
 	if not isinstance(prompt, dict) or not prompt:
 		return json_data
 
-	t0 = time.perf_counter()
-
-	total_fold_count = 0
-	candidates = 0
-	not_foldable: List[str] = []
-	changed_nodes: Set[str] = set()
-	folded_ids: Set[str] = set()
-
-	for pass_idx in range(16):
-		replacements, fold_count, pass_candidates, pass_not_foldable = _constant_fold_switches(prompt, folded_ids)
-		if pass_idx == 0:
-			candidates = pass_candidates
+	# ComfyUI prompt keys are already strings; normalize only in the odd case
+	# they are not, so every pass below can use node ids without re-coercion.
+	if not all(isinstance(k, str) for k in prompt):
+		prompt = {str(k): v for k, v in prompt.items()}
+		json_data["prompt"] = prompt
+
+	# Most prompts contain no switch-like nodes at all; one cheap scan lets us
+	# bail before paying for the folding machinery.
+	if not _prompt_has_switch_candidates(prompt):
+		if _DEBUG or _VERBOSE:
+			_log_debug(f"on_prompt: nodes={len(prompt)}, switch_candidates=0, foldable=0, prune={int(_PRUNE)}, verbose={int(_VERBOSE)}")
+		return json_data
 
-		if fold_count == 0:
-			not_foldable = pass_not_foldable
-			break
+	t0 = time.perf_counter()
 
-		changed_nodes.update(_apply_replacements(prompt, replacements))
-		folded_ids.update(replacements.keys())
-		total_fold_count += fold_count
+	# The fold sweep records replacements without touching the prompt, so one
+	# link index serves both it and the rewrite; _walk_upstream rebuilds its
+	# own because it runs after the links have changed.
+	links = _build_link_index(prompt)
+	replacements, total_fold_count, candidates, not_foldable = _constant_fold_switches(prompt, links)
+	changed_nodes = _apply_replacements(prompt, replacements, links)
 
 	if _VERBOSE:
 		for msg in not_foldable:
@@ -647,8 +836,8 @@ def _handler(json_data: Dict[str, Any]) -> Dict[str, Any]:
 	if _PRUNE:
 		targets = _extract_partial_targets(json_data)
 		start_nodes = _collect_outputs(prompt, targets)
-		new_prompt, removed = _prune_unreachable(prompt, start_nodes)
-		json_data["prompt"] = new_prompt
+		# In-place prune; prompt is json_data["prompt"], no reassignment needed.
+		_, removed = _prune_unreachable(prompt, start_nodes)
 
 	dt_ms = (time.perf_counter() - t0) * 1000.0
 	if _DEBUG or _VERBOSE:
@@ -668,11 +857,19 @@ def _is_existing_handler(handler: Any) -> bool:
 	return "graph_constant_folder" in module_name
 
 def install() -> None:
-	global _installed
+	global _installed, _log_debug, _log_verbose
 	if _installed:
 		return
 	_installed = True
 
+	# The flags are frozen at import, so specialize the logging wrappers once:
+	# disabled levels become no-ops and the per-call flag test disappears from
+	# the dominant non-debug path.
+	if not (_DEBUG or _VERBOSE):
+		_log_debug = _log_noop
+	if not _VERBOSE:
+		_log_verbose = _log_noop
+
 	if not _ENABLED:
 		_log_info("disabled (set GRAPH_CONSTANT_FOLDER_ENABLED=0 or GCF_ENABLED=0)")
 		return